@@ -1,8 +1,278 @@
+import numpy as np
 import pandas as pd
 import yfinance as yf
 import streamlit as st
 from datetime import datetime
-import base64
+from concurrent.futures import ThreadPoolExecutor
+
+# --- Days to the next dividend when none is on record, by payments per year ---
+# monthly (12 or more) and semiannual (6); anything else is treated as quarterly (90)
+NEXT_DIV_FALLBACK_DAYS = {12: 30, 6: 180}
+
+# --- Nanoseconds per day, for int64 timestamp arithmetic ---
+NS_PER_DAY = 86400 * 10**9
+
+# --- Cached yfinance fetches (reused across Streamlit reruns) ---
+@st.cache_data(ttl=3600)
+def _hist(sym, end):
+    return yf.Ticker(sym).history(end=end)
+
+@st.cache_data(ttl=3600)
+def _dividends(sym):
+    return yf.Ticker(sym).dividends
+
+@st.cache_data(ttl=3600)
+def _expirations(sym):
+    return yf.Ticker(sym).options
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def _calls(sym, exp_str):
+    return yf.Ticker(sym).option_chain(exp_str).calls
+
+@st.cache_data(ttl=3600, max_entries=16, show_spinner=False)
+def csv_bytes(df):
+    return df.to_csv(index=False).encode()
+
+# --- Per-strike buy-write math for one expiration (strike/bid/ask are float ndarrays) ---
+def scenario_kernel(strike, bid, ask, stock_price, shares, divs_hold, divs_early, days_held, days_early):
+    option_price = 0.5 * (bid + ask)
+    net_debit = stock_price - option_price
+    premium = strike + option_price - stock_price
+    # One reciprocal of the cost basis, shared by both scenarios' percentages
+    pct_per_dollar = 100 / (shares * net_debit)
+
+    # Both scenarios as rows of one (2, n_strikes) array, computed in a single pass:
+    # row 0 = Hold Dividend (hold to expiration, receive all dividends),
+    # row 1 = Called Early (called before the last projected dividend)
+    scenario_divs = np.array([[divs_hold], [divs_early]], dtype=float)
+    scenario_days = np.array([[days_held], [days_early]], dtype=float)
+    totals = premium + scenario_divs
+    totals *= shares
+    pcts = totals * pct_per_dollar
+    anns = pcts * (365 / scenario_days)
+
+    return option_price, net_debit, premium, totals[0], pcts[0], anns[0], totals[1], pcts[1], anns[1]
+
+# --- Option-chain assembly (cached so filter/what-if reruns skip it) ---
+@st.cache_data(ttl=3600)
+def build_final(stock_symbol, purchase_date, shares, option_chains):
+    # --- Timestamps for calculations ---
+    today = pd.Timestamp(purchase_date, tz="America/New_York")
+    one_year_ago = today - pd.DateOffset(years=1)
+
+    # --- Get last available close on or before purchase date ---
+    hist = _hist(stock_symbol, pd.Timestamp(purchase_date) + pd.Timedelta(days=1))
+    if hist.empty:
+        st.error("No stock price data available for the selected purchase date.")
+        st.stop()
+    stock_price = hist['Close'].iloc[-1]
+
+    # --- Expirations whose chains were fetched (keys are 'YYYY-MM-DD') ---
+    filtered_exps = pd.to_datetime(list(option_chains)).tz_localize("America/New_York")
+
+    # --- Dividend series ---
+    div_series = _dividends(stock_symbol)
+    if not div_series.empty:
+        if div_series.index.tz is None:
+            div_series = div_series.tz_localize("America/New_York")
+
+        # --- Calculate dividend frequency from last 12 months ---
+        recent_divs = div_series[div_series.index >= one_year_ago]
+        div_freq = len(recent_divs) if len(recent_divs) > 0 else 1
+
+        # --- Determine yearly dividend ---
+        yearly_dividend = recent_divs.sum() if not recent_divs.empty else 0
+
+        # --- Determine next dividend date ---
+        next_div_date = div_series[div_series.index > today].index.min()
+        if pd.isna(next_div_date):
+            last_div = div_series.index.max()
+            next_div_date = last_div + pd.DateOffset(days=NEXT_DIV_FALLBACK_DAYS.get(min(div_freq, 12), 90))
+
+        # --- Project future dividend dates based on historical payment pattern ---
+        # Get the most recent historical dividend dates to establish the pattern
+        recent_div_dates = recent_divs.index
+
+        if len(recent_div_dates) >= 2:
+            # Calculate average (whole) days between dividend payments
+            diffs_ns = np.diff(recent_div_dates.as_unit('ns').asi8)
+            avg_days_between = (diffs_ns // NS_PER_DAY).mean()
+        else:
+            # Fallback to frequency-based estimate
+            avg_days_between = 365.25 / div_freq if div_freq > 0 else 365.25
+
+        # Project forward from the last known dividend once, through the furthest expiration;
+        # each expiration then slices its holding period out with searchsorted
+        last_known_div = div_series.index.max()
+        max_exp = filtered_exps.max()
+        n_projected = max(int(np.ceil((max_exp - last_known_div).days / avg_days_between)) + 2, 0)
+        projected_div_dates = last_known_div + pd.to_timedelta(np.arange(1, n_projected + 1) * avg_days_between, unit='D')
+        projected_div_dates = projected_div_dates[projected_div_dates <= max_exp]
+    else:
+        # No dividend history (yfinance returns a bare, RangeIndex Series): nothing to project,
+        # so every dividend count below is 0
+        div_freq = 1
+        yearly_dividend = 0
+        next_div_date = None
+        avg_days_between = 365.25
+        last_known_div = pd.NaT
+        projected_div_dates = pd.DatetimeIndex([], tz="America/New_York")
+
+    all_options = []
+    all_debug_info = []
+
+    # Date comparisons below run on int64 nanoseconds rather than Timestamp objects
+    projected_i8 = projected_div_dates.as_unit('ns').asi8
+    first_div_idx = np.searchsorted(projected_i8, today.value, side='right')
+
+    # Dividend counts for every expiration's holding window in one vectorized pass
+    exp_div_idx = np.searchsorted(projected_i8, filtered_exps.as_unit('ns').asi8, side='right')
+    div_counts = np.maximum(exp_div_idx - first_div_idx, 0)
+
+    single_dividend = yearly_dividend / div_freq if div_freq > 0 else 0
+
+    # --- ITM strike window: 10%–40% below stock price ---
+    lower_bound = stock_price * 0.6
+    upper_bound = stock_price * 0.9
+
+    # --- Loop through filtered expirations ---
+    for exp_pos, opt_chain in enumerate(option_chains.values()):
+        option_exp = filtered_exps[exp_pos]
+        if opt_chain.empty:
+            st.warning(f"No call options for expiration {option_exp.date()}")
+            continue
+
+        # --- Filter ITM strikes on the raw arrays (no filtered DataFrame copy) ---
+        quotes = opt_chain[['strike', 'bid', 'ask']].to_numpy(dtype=float)
+        in_range = (quotes[:, 0] >= lower_bound) & (quotes[:, 0] <= upper_bound)
+        if not in_range.any():
+            st.warning(f"No ITM options 10–40% below stock price for expiration {option_exp.date()}")
+            continue
+
+        # --- Common calculations (plain ndarrays, one DataFrame is built after the loop) ---
+        strike, bid, ask = quotes[in_range].T
+        open_interest = opt_chain['openInterest'].to_numpy()[in_range]
+        n_strikes = len(strike)
+
+        # --- Days Held ---
+        days_held = max((option_exp - today).days, 1)
+
+        # --- Dividend at strike ---
+        div_at_strike = (yearly_dividend / strike) * 100
+
+        # --- Calculate actual dividends during full holding period ---
+        # Projected dividends after purchase date and on or before expiration
+        divs_in_period_i8 = projected_i8[first_div_idx:exp_div_idx[exp_pos]]
+        divs_in_period = projected_div_dates[first_div_idx:exp_div_idx[exp_pos]]  # dates for debug display
+        expected_div_payments = int(div_counts[exp_pos])
+
+        # Calculate total dividends
+        divs_during_period = single_dividend * expected_div_payments
+
+        # Store debug info for later display
+        debug_info = {
+            'option_exp': option_exp,
+            'last_known_div': last_known_div,
+            'avg_days_between': avg_days_between,
+            'divs_in_period': divs_in_period,
+            'expected_div_payments': expected_div_payments,
+            'single_dividend': single_dividend,
+            'divs_during_period': divs_during_period
+        }
+
+        # --- Scenario: Called Early (called 0 days before last dividend) ---
+        # For early call, assume called 0 days before the last dividend payment
+        if len(divs_in_period_i8) > 0:
+            # Early call happens 0 days before the last dividend
+            early_call_i8 = divs_in_period_i8[-1]
+            early_call_date = divs_in_period[-1]
+
+            # Count how many dividends occur before the early call date
+            expected_payments_early = int(np.count_nonzero(divs_in_period_i8 < early_call_i8))
+            divs_received_early = single_dividend * expected_payments_early
+
+            days_held_early = max(int((early_call_i8 - today.value) // NS_PER_DAY), 1)
+        else:
+            # No dividends - early call is same as hold scenario
+            expected_payments_early = 0
+            divs_received_early = 0
+            early_call_date = option_exp
+            days_held_early = days_held
+
+        # Store early call debug info
+        debug_info['early_call'] = {
+            'last_div_date': divs_in_period[-1] if len(divs_in_period) > 0 else None,
+            'early_call_date': early_call_date,
+            'expected_payments_early': expected_payments_early,
+            'divs_received_early': divs_received_early,
+            'days_held_early': days_held_early
+        }
+
+        # --- Hold Dividend and Called Early scenarios for every strike ---
+        (option_price, net_debit, option_premium,
+         hold_total, hold_pct, hold_ann,
+         early_total, early_pct, early_ann) = scenario_kernel(
+            strike, bid, ask, stock_price, shares,
+            divs_during_period, divs_received_early, days_held, days_held_early)
+
+        # --- Premium after one dividend payment (for reference) ---
+        premium_minus_div = option_premium - single_dividend
+
+        # --- Collect this expiration's columns; concatenated once after the loop ---
+        all_options.append({
+            'Option Expiration': np.full(n_strikes, option_exp.date(), dtype=object),
+            'Strike': strike,
+            'Option Price': option_price,
+            'Net Debit': net_debit,
+            'Option Premium': option_premium,
+            'Open Interest': open_interest,
+            'Premium - Single Dividend': premium_minus_div,
+            'Dividend at Strike Price': div_at_strike,
+            'Hold Dividend: # of Payments': np.full(n_strikes, expected_div_payments),
+            'Hold Dividend: Dividend + Premium': hold_total,
+            'Hold Dividend: Total %': hold_pct,
+            'Hold Dividend: Annualized %': hold_ann,
+            'Called Early: # of Payments': np.full(n_strikes, expected_payments_early),
+            'Called Early: Dividend + Premium': early_total,
+            'Called Early: Total %': early_pct,
+            'Called Early: Annualized %': early_ann
+        })
+        all_debug_info.append(debug_info)
+
+    # --- Combine all expirations ---
+    if all_options:
+        per_strike = {
+            col: np.concatenate([opts[col] for opts in all_options])
+            for col in all_options[0]
+        }
+        # Purchase-level metadata is identical on every row, so broadcast each scalar once here
+        final_df = pd.DataFrame({
+            'Date Purchased': today.date(),
+            'Stock': stock_symbol,
+            'Stock Price': stock_price,
+            'Forward Dividend $': yearly_dividend,
+            'Forward Dividend %': (yearly_dividend / stock_price) * 100,
+            'Dividend Frequency': div_freq,
+            'Next Dividend Date': next_div_date.date() if next_div_date is not None else None,
+            **per_strike
+        })
+    else:
+        st.warning("No ITM options 10–40% below stock price found in the 6–18 month window.")
+        st.stop()
+
+    # --- Add "Meet Criteria" column BEFORE formatting ---
+    # Criteria: Option Premium > 0, Hold Dividend Total % > 10%, Hold Dividend Annualized % > 10%
+    final_df['Meet Criteria'] = (
+        (final_df['Option Premium'] > 0) & 
+        (final_df['Hold Dividend: Total %'] > 10) & 
+        (final_df['Hold Dividend: Annualized %'] > 10)
+    )
+
+    # --- Store numeric value for sorting BEFORE formatting ---
+    final_df['Hold_Total_Numeric'] = final_df['Hold Dividend: Total %']
+
+    return (final_df, all_debug_info, stock_price, yearly_dividend, div_freq, next_div_date,
+            single_dividend, projected_i8, first_div_idx)
 
 # --- User Inputs ---
 stock_symbol = st.text_input("Enter Stock Ticker", "OKE")
@@ -14,234 +284,43 @@ purchase_date = st.date_input("Date Purchased", datetime.today())
 # Filter toggle for criteria
 filter_criteria = st.checkbox("Show only options that meet criteria", value=False)
 
-# --- Fetch stock data ---
-stock = yf.Ticker(stock_symbol)
-
-# --- Get last available close on or before purchase date ---
-hist = stock.history(end=pd.Timestamp(purchase_date) + pd.Timedelta(days=1))
-if hist.empty:
-    st.error("No stock price data available for the selected purchase date.")
-    st.stop()
-stock_price = hist['Close'][-1]
-
-# --- Dividend series ---
-div_series = stock.dividends
-if not div_series.empty:
-    if div_series.index.tz is None:
-        div_series = div_series.tz_localize("America/New_York")
-
-    # --- Calculate dividend frequency from last 12 months ---
-    one_year_ago = pd.Timestamp(purchase_date).tz_localize("America/New_York") - pd.DateOffset(years=1)
-    recent_divs = div_series[div_series.index >= one_year_ago]
-    div_freq = len(recent_divs) if len(recent_divs) > 0 else 1
-
-    # --- Determine yearly dividend ---
-    yearly_dividend = recent_divs.sum() if not recent_divs.empty else 0
-
-    # --- Determine next dividend date ---
-    next_div_date = div_series[div_series.index > pd.Timestamp(purchase_date).tz_localize("America/New_York")].index.min()
-    if pd.isna(next_div_date):
-        last_div = div_series.index.max()
-        if div_freq >= 12:  # monthly
-            next_div_date = last_div + pd.DateOffset(days=30)
-        elif div_freq == 6:  # semiannual
-            next_div_date = last_div + pd.DateOffset(days=180)
-        else:  # quarterly by default
-            next_div_date = last_div + pd.DateOffset(days=90)
-else:
-    div_freq = 1
-    yearly_dividend = 0
-    next_div_date = None
-
-# --- Timestamp for calculations ---
-today = pd.Timestamp(purchase_date).tz_localize("America/New_York")
-
-all_options = []
-all_debug_info = []
+today = pd.Timestamp(purchase_date, tz="America/New_York")
 
 # --- Identify expirations 6 to 18 months out ---
-available_exps = stock.options
-filtered_exps = []
-for exp_str in available_exps:
-    exp_date = pd.Timestamp(exp_str).tz_localize("America/New_York")
-    if 6*30 <= (exp_date - today).days <= 18*30:  # approx 6–18 months
-        filtered_exps.append(exp_date)
-
-if not filtered_exps:
+available_exps = _expirations(stock_symbol)
+exps_idx = pd.to_datetime(list(available_exps)).tz_localize("America/New_York")
+days_out = (exps_idx - today).days.to_numpy()
+filtered_exps = exps_idx[(days_out >= 6*30) & (days_out <= 18*30)]  # approx 6–18 months
+
+if filtered_exps.empty:
     st.warning("No expirations available between 6 and 18 months from purchase date.")
     st.stop()
 
-# --- Loop through filtered expirations ---
-for option_exp in filtered_exps:
-    try:
-        opt_chain = stock.option_chain(option_exp.strftime('%Y-%m-%d')).calls
-    except Exception as e:
-        st.warning(f"Error fetching option chain for {option_exp.date()}: {e}")
-        continue
-
-    if opt_chain.empty:
-        st.warning(f"No call options for expiration {option_exp.date()}")
-        continue
-
-    # --- Filter ITM strikes: 10%–40% below stock price ---
-    lower_bound = stock_price * 0.6
-    upper_bound = stock_price * 0.9
-    opt_chain = opt_chain[(opt_chain['strike'] >= lower_bound) & (opt_chain['strike'] <= upper_bound)]
-    if opt_chain.empty:
-        st.warning(f"No ITM options 10–40% below stock price for expiration {option_exp.date()}")
-        continue
-
-    # --- Common calculations ---
-    opt_chain['Option Price'] = (opt_chain['bid'] + opt_chain['ask']) / 2
-    opt_chain['Net Debit'] = stock_price - opt_chain['Option Price']
-    opt_chain['Option Premium'] = opt_chain['strike'] + opt_chain['Option Price'] - stock_price
-    opt_chain['Open Interest'] = opt_chain['openInterest']
-
-    # --- Days Held ---
-    days_held = max((option_exp - today).days, 1)
-    opt_chain['Days Held'] = days_held
-    opt_chain['Option Expiration'] = option_exp.date()
-
-    # --- Dividend at strike ---
-    opt_chain['Dividend at Strike Price'] = (yearly_dividend / opt_chain['strike']) * 100
-
-    # --- Calculate actual dividends during full holding period ---
-    # Project future dividend dates based on historical payment pattern
-    
-    # Get the most recent historical dividend dates to establish the pattern
-    recent_div_dates = div_series[div_series.index >= one_year_ago].index
-    
-    if len(recent_div_dates) >= 2:
-        # Calculate average days between dividend payments
-        date_diffs = [(recent_div_dates[i] - recent_div_dates[i-1]).days for i in range(1, len(recent_div_dates))]
-        avg_days_between = sum(date_diffs) / len(date_diffs)
-    else:
-        # Fallback to frequency-based estimate
-        avg_days_between = 365.25 / div_freq if div_freq > 0 else 365.25
-    
-    # Project dividend dates forward from the last known dividend
-    last_known_div = div_series.index.max()
-    projected_div_dates = []
-    next_div = last_known_div + pd.Timedelta(days=avg_days_between)
-    
-    # Project until we're past the option expiration
-    while next_div <= option_exp:
-        projected_div_dates.append(next_div)
-        next_div = next_div + pd.Timedelta(days=avg_days_between)
-    
-    # Count dividends that fall after purchase date and on or before expiration
-    divs_in_period = [d for d in projected_div_dates if d > today and d <= option_exp]
-    expected_div_payments = len(divs_in_period)
-    
-    # Calculate total dividends
-    single_dividend = yearly_dividend / div_freq if div_freq > 0 else 0
-    divs_during_period = single_dividend * expected_div_payments
-    
-    # Store debug info for later display
-    debug_info = {
-        'option_exp': option_exp,
-        'last_known_div': last_known_div,
-        'avg_days_between': avg_days_between,
-        'divs_in_period': divs_in_period,
-        'expected_div_payments': expected_div_payments,
-        'single_dividend': single_dividend,
-        'divs_during_period': divs_during_period
-    }
-
-    # --- Scenario: Hold Dividend (hold to expiration, receive all dividends) ---
-    hold = pd.DataFrame(index=opt_chain.index)
-    hold['Dividend + Premium'] = (opt_chain['Option Premium'].values * shares) + (divs_during_period * shares)
-    hold['Total %'] = hold['Dividend + Premium'] / (shares * opt_chain['Net Debit'].values) * 100
-    hold['Annualized %'] = hold['Total %'] * (365 / days_held)
-
-    # --- Scenario: Called Early (called 0 days before last dividend) ---
-    # For early call, assume called 0 days before the last dividend payment
-    if len(divs_in_period) > 0:
-        # Get the last dividend date
-        last_div_date = divs_in_period[-1]
-        
-        # Early call happens 0 days before the last dividend
-        early_call_date = last_div_date - pd.Timedelta(days=0)
-        
-        # Count how many dividends occur before the early call date
-        early_divs = [d for d in divs_in_period if d < early_call_date]
-        expected_payments_early = len(early_divs)
-        divs_received_early = single_dividend * expected_payments_early
-        
-        days_held_early = max((early_call_date - today).days, 1)
-    else:
-        # No dividends - early call is same as hold scenario
-        expected_payments_early = 0
-        divs_received_early = 0
-        early_call_date = option_exp
-        days_held_early = days_held
-
-    # Store early call debug info
-    debug_info['early_call'] = {
-        'last_div_date': divs_in_period[-1] if len(divs_in_period) > 0 else None,
-        'early_call_date': early_call_date,
-        'expected_payments_early': expected_payments_early,
-        'divs_received_early': divs_received_early,
-        'days_held_early': days_held_early
+# --- Fetch option chains concurrently (one round trip instead of one per expiration) ---
+# Done outside build_final so a failed fetch is retried on the next rerun instead of
+# leaving a partial table in its cache
+with ThreadPoolExecutor(max_workers=8) as pool:
+    chain_futures = {
+        exp_str: pool.submit(_calls, stock_symbol, exp_str)
+        for exp_str in filtered_exps.strftime('%Y-%m-%d')
     }
 
-    early = pd.DataFrame(index=opt_chain.index)
-    early['Dividend + Premium'] = (opt_chain['Option Premium'].values * shares) + (divs_received_early * shares)
-    early['Total %'] = early['Dividend + Premium'] / (shares * opt_chain['Net Debit'].values) * 100
-    early['Annualized %'] = early['Total %'] * (365 / days_held_early)
-
-    # --- Premium after one dividend payment (for reference) ---
-    opt_chain['Premium - Single Dividend'] = opt_chain['Option Premium'] - single_dividend
-
-    # --- Combine scenarios into final DataFrame ---
-    combined = pd.DataFrame({
-        'Date Purchased': today.date(),
-        'Stock': stock_symbol,
-        'Stock Price': stock_price,
-        'Forward Dividend $': yearly_dividend,
-        'Forward Dividend %': (yearly_dividend / stock_price) * 100,
-        'Dividend Frequency': div_freq,
-        'Next Dividend Date': next_div_date.date() if next_div_date is not None else None,
-        'Option Expiration': option_exp.date(),
-        'Strike': opt_chain['strike'],
-        'Option Price': opt_chain['Option Price'],
-        'Net Debit': opt_chain['Net Debit'],
-        'Option Premium': opt_chain['Option Premium'],
-        'Open Interest': opt_chain['openInterest'],
-        'Premium - Single Dividend': opt_chain['Premium - Single Dividend'],
-        'Dividend at Strike Price': opt_chain['Dividend at Strike Price'],
-        'Hold Dividend: # of Payments': expected_div_payments,
-        'Hold Dividend: Dividend + Premium': hold['Dividend + Premium'],
-        'Hold Dividend: Total %': hold['Total %'],
-        'Hold Dividend: Annualized %': hold['Annualized %'],
-        'Called Early: # of Payments': expected_payments_early,
-        'Called Early: Dividend + Premium': early['Dividend + Premium'],
-        'Called Early: Total %': early['Total %'],
-        'Called Early: Annualized %': early['Annualized %']
-    })
-
-    all_options.append(combined)
-    all_debug_info.append(debug_info)
+option_chains = {}
+for exp_str, future in chain_futures.items():
+    try:
+        option_chains[exp_str] = future.result()
+    except Exception as e:
+        st.warning(f"Error fetching option chain for {exp_str}: {e}")
 
-# --- Combine all expirations ---
-if all_options:
-    final_df = pd.concat(all_options, ignore_index=True)
-else:
+if not option_chains:
     st.warning("No ITM options 10–40% below stock price found in the 6–18 month window.")
     st.stop()
 
-# --- Add "Meet Criteria" column BEFORE formatting ---
-# Criteria: Option Premium > 0, Hold Dividend Total % > 10%, Hold Dividend Annualized % > 10%
-final_df['Meet Criteria'] = (
-    (final_df['Option Premium'] > 0) & 
-    (final_df['Hold Dividend: Total %'] > 10) & 
-    (final_df['Hold Dividend: Annualized %'] > 10)
-)
-
-# --- Store numeric value for sorting BEFORE formatting ---
-final_df['Hold_Total_Numeric'] = final_df['Hold Dividend: Total %']
+# --- Build numeric options table ---
+(final_df, all_debug_info, stock_price, yearly_dividend, div_freq, next_div_date,
+ single_dividend, projected_i8, first_div_idx) = build_final(stock_symbol, purchase_date, shares, option_chains)
 
-# --- Format % columns ---
+# --- Round % columns (kept numeric so sorting works; the Styler adds the % sign) ---
 pct_cols = [
     'Forward Dividend %',
     'Dividend at Strike Price',
@@ -249,7 +328,8 @@ pct_cols = [
     'Called Early: Total %','Called Early: Annualized %'
 ]
 for col in pct_cols:
-    final_df[col] = final_df[col].map(lambda x: f"{x:.2f}%")
+    final_df[col] = final_df[col].round(2)
+pct_format = {col: "{:.2f}%" for col in pct_cols}
 
 # --- Apply filter if checkbox is selected ---
 if filter_criteria:
@@ -273,34 +353,34 @@ display_cols = [
 # --- Highlight top 3 ROI rows ---
 top_3_indices = final_df.nlargest(3, 'Hold_Total_Numeric').index
 
-def highlight_top_3_rows(x):
-    colors = []
-    for i in x.index:
-        if i == top_3_indices[0]:
-            colors.append('background-color: lightgreen')
-        elif i in top_3_indices[1:].tolist():
-            colors.append('background-color: lightyellow')
-        else:
-            colors.append('')
-    return colors
+row_colors = np.full(len(final_df), '', dtype=object)
+row_colors[final_df.index.get_indexer(top_3_indices[1:])] = 'background-color: lightyellow'
+row_colors[final_df.index.get_indexer(top_3_indices[:1])] = 'background-color: lightgreen'
+
+def highlight_top_3_rows(df):
+    return pd.DataFrame(np.repeat(row_colors[:, None], df.shape[1], axis=1), index=df.index, columns=df.columns)
 
 st.subheader(f"{stock_symbol} Buy-Write Dashboard (6–18 Months, ITM 10–40% below stock)")
-st.dataframe(final_df[display_cols].style.apply(highlight_top_3_rows, axis=1))
+st.dataframe(final_df[display_cols].style.format(pct_format).apply(highlight_top_3_rows, axis=None))
 
-# --- Best Overall Option ---
-best_option_df = pd.DataFrame([final_df.loc[top_3_indices[0]]])
+# --- Best Overall Option (row slice keeps column dtypes) ---
+best_option_df = final_df.loc[top_3_indices[:1]].reset_index(drop=True)
 st.subheader("Best Overall Option (Hold Dividend scenario)")
-st.dataframe(best_option_df[display_cols])
-
-# --- Download CSV ---
-def get_table_download_link(df, filename="options_data.csv"):
-    csv = df.to_csv(index=False)
-    b64 = base64.b64encode(csv.encode()).decode()
-    href = f'<a href="data:file/csv;base64,{b64}" download="{filename}">Download CSV</a>'
-    return href
-
-st.markdown(get_table_download_link(final_df), unsafe_allow_html=True)
-st.markdown(get_table_download_link(best_option_df, filename="best_option.csv"), unsafe_allow_html=True)
+st.dataframe(best_option_df[display_cols].style.format(pct_format))
+
+# --- Download CSV (served on click instead of embedded in the page as a data URL) ---
+def csv_download_button(df, filename="options_data.csv"):
+    st.download_button(
+        "Download CSV",
+        data=csv_bytes(df),
+        file_name=filename,
+        mime="text/csv",
+        key=f"download_{filename}",
+        on_click="ignore"
+    )
+
+csv_download_button(final_df)
+csv_download_button(best_option_df, filename="best_option.csv")
 
 # --- What-If Scenario Calculator ---
 st.subheader("What-If Scenario Calculator")
@@ -323,12 +403,13 @@ if st.button("Calculate What-If Scenario"):
     whatif_premium_minus_div = whatif_option_premium - single_dividend
     
     # Calculate days held
-    whatif_exp_ts = pd.Timestamp(whatif_expiration).tz_localize("America/New_York")
+    whatif_exp_ts = pd.Timestamp(whatif_expiration, tz="America/New_York")
     whatif_days_held = max((whatif_exp_ts - today).days, 1)
     
     # Project dividends for what-if scenario
-    whatif_divs_in_period = [d for d in projected_div_dates if d > today and d <= whatif_exp_ts]
-    whatif_expected_payments = len(whatif_divs_in_period)
+    whatif_div_idx = np.searchsorted(projected_i8, whatif_exp_ts.value, side='right')
+    whatif_divs_i8 = projected_i8[first_div_idx:whatif_div_idx]
+    whatif_expected_payments = len(whatif_divs_i8)
     whatif_divs_during_period = single_dividend * whatif_expected_payments
     
     # Hold scenario
@@ -337,13 +418,11 @@ if st.button("Calculate What-If Scenario"):
     whatif_hold_ann = whatif_hold_pct * (365 / whatif_days_held)
     
     # Early call scenario
-    if len(whatif_divs_in_period) > 0:
-        whatif_last_div = whatif_divs_in_period[-1]
-        whatif_early_call = whatif_last_div - pd.Timedelta(days=0)
-        whatif_early_divs = [d for d in whatif_divs_in_period if d < whatif_early_call]
-        whatif_early_payments = len(whatif_early_divs)
+    if len(whatif_divs_i8) > 0:
+        whatif_early_call_i8 = whatif_divs_i8[-1]
+        whatif_early_payments = int(np.count_nonzero(whatif_divs_i8 < whatif_early_call_i8))
         whatif_divs_early = single_dividend * whatif_early_payments
-        whatif_days_early = max((whatif_early_call - today).days, 1)
+        whatif_days_early = max(int((whatif_early_call_i8 - today.value) // NS_PER_DAY), 1)
     else:
         whatif_early_payments = 0
         whatif_divs_early = 0
@@ -393,29 +472,26 @@ if st.button("Calculate What-If Scenario"):
     })
     
     st.dataframe(whatif_results[display_cols])
-    st.markdown(get_table_download_link(whatif_results, filename="whatif_scenario.csv"), unsafe_allow_html=True)
+    csv_download_button(whatif_results, filename="whatif_scenario.csv")
 
 # --- Debug Information ---
-st.subheader("Debug Information")
-for debug_info in all_debug_info:
-    st.write(f"=== Expiration {debug_info['option_exp'].date()} ===")
-    st.write(f"Last known dividend: {debug_info['last_known_div'].date()}")
-    st.write(f"Avg days between dividends: {debug_info['avg_days_between']:.1f}")
-    st.write(f"Projected dividend dates in holding period:")
-    for d in debug_info['divs_in_period']:
-        st.write(f"  - {d.date()}")
-    st.write(f"Number of dividend payments: {debug_info['expected_div_payments']}")
-    st.write(f"Single dividend: ${debug_info['single_dividend']:.4f}")
-    st.write(f"Total dividends: ${debug_info['divs_during_period']:.4f}")
-    st.write(f"")
-    st.write(f"Early call scenario:")
-    if debug_info['early_call']['last_div_date']:
-        st.write(f"  Last dividend date: {debug_info['early_call']['last_div_date'].date()}")
-    else:
-        st.write(f"  Last dividend date: N/A")
-    st.write(f"  Early call date (0 days before last div): {debug_info['early_call']['early_call_date'].date()}")
-    st.write(f"  Dividends received if called early: {debug_info['early_call']['expected_payments_early']}")
-    st.write(f"  Total dividends: ${debug_info['early_call']['divs_received_early']:.4f}")
-    st.write(f"  Days held: {debug_info['early_call']['days_held_early']}")
-    st.write(f"===")
-    st.write("")
\ No newline at end of file
+# One row per expiration, rendered as a single table instead of a write() per line
+with st.expander("Debug Information", expanded=False):
+    debug_df = pd.DataFrame([
+        {
+            'Expiration': debug_info['option_exp'].date(),
+            'Last Known Dividend': debug_info['last_known_div'].date() if pd.notna(debug_info['last_known_div']) else None,
+            'Avg Days Between Dividends': round(debug_info['avg_days_between'], 1),
+            'Projected Dividend Dates': ', '.join(str(d.date()) for d in debug_info['divs_in_period']),
+            'Hold: # of Payments': debug_info['expected_div_payments'],
+            'Single Dividend $': round(debug_info['single_dividend'], 4),
+            'Hold: Total Dividends $': round(debug_info['divs_during_period'], 4),
+            'Early: Last Dividend Date': debug_info['early_call']['last_div_date'].date() if debug_info['early_call']['last_div_date'] is not None else None,
+            'Early: Call Date': debug_info['early_call']['early_call_date'].date(),
+            'Early: # of Payments': debug_info['early_call']['expected_payments_early'],
+            'Early: Total Dividends $': round(debug_info['early_call']['divs_received_early'], 4),
+            'Early: Days Held': debug_info['early_call']['days_held_early']
+        }
+        for debug_info in all_debug_info
+    ])
+    st.dataframe(debug_df)